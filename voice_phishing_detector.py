@@ -1,8 +1,21 @@
 import streamlit as st
-import os
-import tempfile
+import asyncio
 from webpage.practive_voice import VoiceToTextConverter
-from webpage.model.graph_model import analyze_voice_phishing
+from webpage.model.graph_model import VoicePhishingDetector
+
+# 첫 중간 분석을 시작할 새 텍스트 분량 (글자 수)
+# 중간 분석은 매번 전체 대화를 다시 보내므로, 이후 기준은 분석할 때마다 두 배로 늘려 호출 횟수를 제한
+ANALYSIS_CHUNK_CHARS = 500
+
+@st.cache_resource(show_spinner=False)
+def get_converter(model_size):
+    """모델 크기별 음성 인식 모델을 한 번만 로딩하여 재사용"""
+    return VoiceToTextConverter(model_size=model_size)
+
+@st.cache_resource(show_spinner=False)
+def get_detector():
+    """LangGraph 탐지 모델을 한 번만 구성하여 재사용"""
+    return VoicePhishingDetector()
 
 def main():
     st.set_page_config(
@@ -14,6 +27,13 @@ def main():
     st.title("🔍 보이스피싱 탐지 시스템")
     st.markdown("---")
     
+    # 분석 결과 상태 초기화 (재실행 시에도 결과 유지)
+    st.session_state.setdefault("processed", False)
+    st.session_state.setdefault("result", None)
+    st.session_state.setdefault("phishing_result", None)
+    st.session_state.setdefault("risk_score", None)
+    st.session_state.setdefault("result_file_id", None)
+    
     # 사이드바 설정
     st.sidebar.header("설정")
     model_size = st.sidebar.selectbox(
@@ -54,6 +74,10 @@ def main():
         # 분석 실행
         if analyze_button:
             analyze_audio(uploaded_file, model_size, language)
+        
+        # 결과 표시 (현재 업로드된 파일의 분석 결과가 있을 때만)
+        if st.session_state.processed and st.session_state.result_file_id == uploaded_file.file_id:
+            render_results()
     else:
         st.info("음성 파일을 업로드해주세요.")
 
@@ -63,94 +87,185 @@ def analyze_audio(uploaded_file, model_size, language):
     # 진행 상황 표시
     progress_bar = st.progress(0)
     status_text = st.empty()
+    interim_box = st.empty()
     
     try:
-        # 1. 임시 파일로 저장
-        status_text.text("📁 파일 준비 중...")
-        progress_bar.progress(10)
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            temp_file_path = tmp_file.name
-        
-        # 2. 음성 인식 모델 초기화
+        # 1. 음성 인식 모델 초기화
         status_text.text("🤖 AI 모델 로딩 중...")
         progress_bar.progress(30)
         
-        converter = VoiceToTextConverter(model_size=model_size)
+        converter = get_converter(model_size)
         
-        # 3. 음성을 텍스트로 변환
+        # 2~3. 음성 인식과 보이스피싱 분석을 겹쳐서 실행
         status_text.text("🎤 음성 인식 처리 중...")
-        progress_bar.progress(60)
-        result = converter.transcribe_audio(temp_file_path, language=language)
-        transcribed_text = result["text"]
+        segments, info = converter.transcribe_stream(uploaded_file, language=language)
+        result, analysis = asyncio.run(
+            transcribe_and_analyze(segments, info, get_detector(), progress_bar, status_text, interim_box)
+        )
+        interim_box.empty()
         
-        # 4. 보이스피싱 분석
-        status_text.text("🔍 보이스피싱 분석 중...")
-        progress_bar.progress(80)
+        # 4. 결과 저장
+        st.session_state.result = result
+        st.session_state.phishing_result = analysis["content"]
+        st.session_state.risk_score = analysis["score"]
+        st.session_state.result_file_id = uploaded_file.file_id
+        st.session_state.processed = True
         
-        phishing_result = analyze_voice_phishing(transcribed_text)
-        
-        # 5. 결과 표시
         status_text.text("✅ 분석 완료!")
         progress_bar.progress(100)
         
-        # 결과 섹션 - 전체 화면에 표시
-        st.markdown("---")
-        
-        # 보이스피싱 분석 결과
-        st.subheader("🚨 보이스피싱 분석 결과")
-        
-        # 위험도 판단 (간단한 키워드 기반)
-
-        risk_score = int(phishing_result.splitlines()[0].split(":")[1])
-        if risk_score >= 7:
-            st.error("⚠️ **높은 위험도** - 보이스피싱 가능성이 높습니다!")
-        elif risk_score >= 4:
-            st.warning("⚡ **중간 위험도** - 주의가 필요합니다.")
-        else:
-            st.success("✅ **낮은 위험도** - 정상적인 통화로 보입니다.")
-        
-        # AI 분석 결과
-        with st.expander("AI 상세 분석 결과", expanded=True):
-            st.markdown(phishing_result)
-        
-        # 음성 인식 결과 버튼들
-        st.markdown("---")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("📝 변환된 텍스트 보기", use_container_width=True):
-                st.session_state.show_text = True
-                st.session_state.show_segments = False
-        
-        with col2:
-            if st.button("🎯 세그먼트별 상세 보기", use_container_width=True):
-                st.session_state.show_segments = True
-                st.session_state.show_text = False
-        
-        # 텍스트 표시
-        if st.session_state.get('show_text', False):
-            st.subheader("📝 변환된 텍스트")
-            st.text_area("전체 텍스트", transcribed_text, height=300, key="text_display")
-        
-        # 세그먼트 표시
-        if st.session_state.get('show_segments', False) and "segments" in result:
-            st.subheader("🎯 세그먼트별 상세 내용")
-            for i, segment in enumerate(result["segments"]):
-                start_time = format_time(segment["start"])
-                end_time = format_time(segment["end"])
-                st.write(f"**[{start_time} - {end_time}]** {segment['text']}")
-        
-        # 임시 파일 정리
-        os.unlink(temp_file_path)
-        
     except Exception as e:
+        st.session_state.processed = False
         st.error(f"❌ 분석 중 오류가 발생했습니다: {str(e)}")
         status_text.text("❌ 분석 실패")
         progress_bar.progress(0)
 
+def render_results():
+    """보이스피싱 분석 결과 표시"""
+    phishing_result = st.session_state.phishing_result
+    
+    # 결과 섹션 - 전체 화면에 표시
+    st.markdown("---")
+    
+    # 보이스피싱 분석 결과
+    st.subheader("🚨 보이스피싱 분석 결과")
+    
+    # 위험도 판단 (구조화된 분석 결과의 score 값 기반)
+    risk_score = st.session_state.risk_score
+    if risk_score is None:
+        st.info("❔ **위험도 판단 불가** - 분석 결과에서 점수를 확인하지 못했습니다.")
+    elif risk_score >= 7:
+        st.error("⚠️ **높은 위험도** - 보이스피싱 가능성이 높습니다!")
+    elif risk_score >= 4:
+        st.warning("⚡ **중간 위험도** - 주의가 필요합니다.")
+    else:
+        st.success("✅ **낮은 위험도** - 정상적인 통화로 보입니다.")
+    
+    # AI 분석 결과
+    with st.expander("AI 상세 분석 결과", expanded=True):
+        st.markdown(phishing_result)
+    
+    render_transcript_browser()
+
+@st.fragment
+def render_transcript_browser():
+    """음성 인식 결과 보기 (버튼 클릭 시 이 영역만 다시 실행)"""
+    result = st.session_state.result
+    
+    # 음성 인식 결과 버튼들
+    st.markdown("---")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("📝 변환된 텍스트 보기", use_container_width=True):
+            st.session_state.show_text = True
+            st.session_state.show_segments = False
+    
+    with col2:
+        if st.button("🎯 세그먼트별 상세 보기", use_container_width=True):
+            st.session_state.show_segments = True
+            st.session_state.show_text = False
+    
+    # 텍스트 표시
+    if st.session_state.get('show_text', False):
+        st.subheader("📝 변환된 텍스트")
+        st.text_area("전체 텍스트", result["text"], height=300, key="text_display")
+    
+    # 세그먼트 표시
+    if st.session_state.get('show_segments', False) and "segments" in result:
+        st.subheader("🎯 세그먼트별 상세 내용")
+        for i, segment in enumerate(result["segments"]):
+            start_time = format_time(segment["start"])
+            end_time = format_time(segment["end"])
+            st.write(f"**[{start_time} - {end_time}]** {segment['text']}")
+
+async def transcribe_and_analyze(segments, info, detector, progress_bar, status_text, interim_box):
+    """
+    세그먼트가 생성되는 대로 텍스트를 모으고, 일정 분량이 쌓일 때마다 지금까지의 대화를 백그라운드에서 분석
+    중간 분석 결과는 끝나는 대로 interim_box에 표시
+    반환값: (음성 인식 결과, 전체 대화에 대한 분석 결과 {"score", "content", "cached_tokens"})
+    """
+    collected = []
+    task = None  # 진행 중인 중간 분석
+    task_count = 0  # 진행 중인 중간 분석이 포함한 세그먼트 수
+    latest = None  # 마지막으로 끝난 중간 분석 (포함한 세그먼트 수, 결과)
+    pending_chars = 0
+    next_threshold = ANALYSIS_CHUNK_CHARS
+    
+    while True:
+        # 세그먼트 디코딩은 별도 스레드에서 수행하여 분석 태스크와 동시에 진행
+        segment = await asyncio.to_thread(next, segments, None)
+        if segment is None:
+            break
+        
+        collected.append(segment)
+        pending_chars += len(segment["text"])
+        if info.duration > 0:
+            progress_bar.progress(30 + int(50 * min(segment["end"] / info.duration, 1.0)))
+        
+        # 끝난 중간 분석은 바로 화면에 표시
+        if task is not None and task.done():
+            interim = show_interim_result(task, interim_box)
+            if interim is not None:
+                latest = (task_count, interim)
+            task = None
+        
+        # 진행 중인 분석이 없고 새 텍스트가 충분히 쌓였으면 중간 분석 시작
+        if pending_chars >= next_threshold and task is None:
+            task_count = len(collected)
+            pending_chars = 0
+            next_threshold *= 2
+            task = asyncio.create_task(detector.analyze_async(join_segments(collected)))
+    
+    result = {
+        "text": join_segments(collected),
+        "segments": collected,
+        "language": info.language
+    }
+    
+    # 인식된 음성이 없으면 분석하지 않음
+    if not result["text"]:
+        return result, {
+            "score": None,
+            "content": "인식된 음성이 없어 보이스피싱 분석을 진행하지 않았습니다.",
+            "cached_tokens": 0
+        }
+    
+    status_text.text("🔍 보이스피싱 분석 중...")
+    progress_bar.progress(80)
+    
+    # 진행 중인 중간 분석이 전체 대화를 포함하면 그 결과를 사용하고, 아니면 취소
+    if task is not None:
+        if task_count == len(collected):
+            try:
+                return result, await task
+            except Exception as e:
+                print(f"중간 분석 실패, 전체 텍스트로 다시 분석합니다: {e}")
+        else:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    
+    # 마지막 중간 분석이 전체 대화를 포함하면 재사용, 아니면 전체 텍스트로 다시 분석
+    if latest is not None and latest[0] == len(collected):
+        return result, latest[1]
+    return result, await detector.analyze_async(result["text"])
+
+def show_interim_result(task, interim_box):
+    """끝난 중간 분석 결과를 표시하고 반환 (실패한 경우 None)"""
+    if task.exception() is not None:
+        print(f"중간 분석 실패: {task.exception()}")
+        return None
+    
+    analysis = task.result()
+    score_text = "확인 불가" if analysis["score"] is None else f"{analysis['score']}/10"
+    interim_box.info(f"🕒 **중간 분석 결과** (지금까지의 통화 내용 기준, 위험도 {score_text})\n\n{analysis['content']}")
+    return analysis
+
+def join_segments(segments):
+    """세그먼트 텍스트를 하나의 문자열로 결합"""
+    return "".join(segment["text"] for segment in segments).strip()
+
 def format_time(seconds):
     """초를 MM:SS 형식으로 변환"""
     minutes = int(seconds // 60)
@@ -1,31 +1,144 @@
 # 보이스피싱 탐지를 위한 랭그래프 모델
+import asyncio
+import concurrent.futures
+import functools
+import operator
 import os
-from typing import Annotated, TypedDict
-from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph
-from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode
-from langchain_core.prompts import ChatPromptTemplate
-from dotenv import load_dotenv
-from langchain_tavily import TavilySearch
+import threading
+import time
+from collections import OrderedDict
+from typing import Annotated, Optional, TypedDict
+from pydantic import BaseModel, Field
 
-# .env 파일 로드
-load_dotenv()
+# LangChain/LangGraph 관련 모듈은 import 비용이 커서 실제로 탐지기를 만들 때 불러옴
+# (Streamlit 첫 화면이 모델 로딩을 기다리지 않도록)
 
 
+@functools.cache
+def _ensure_env():
+    """.env 파일 로드 (최초 1회)"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+# 웹 검색 결과 캐시 설정
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 3600  # 초
+
+
+# 아래 고정 텍스트들은 프롬프트의 system 메시지에 그대로 포함되어, OpenAI 자동 프롬프트 캐싱
+# (1024 토큰 이상 동일 prefix)이 적용되도록 길이를 유지합니다. 내용을 바꾸면 캐시가 초기화됩니다.
+
+# 보이스피싱 유형별 특징 (검색 판단/분석 프롬프트 공통)
+PHISHING_PATTERNS = """
+[보이스피싱 유형별 특징]
+
+1. 기관 사칭형
+- 검찰, 경찰, 금융감독원, 금융위원회, 국세청, 법원 등 공공기관을 사칭하며 수사나 조사를 언급함
+- "사건에 연루되었다", "계좌가 범죄에 이용되었다", "명의가 도용되었다" 등 피해자를 잠재적 피의자로 몰아감
+- 공문서, 사건번호, 담당 검사 이름 등을 제시하며 신뢰를 얻으려 하지만 공식 대표번호로의 확인을 막음
+- 실제 공공기관은 전화로 계좌이체, 현금 인출, 안전계좌 이동, 금융 정보 제공을 절대 요구하지 않음
+- 수사 보안을 이유로 가족이나 주변인에게 알리지 말라고 하거나 통화를 끊지 못하게 함
+
+2. 대출 빙자형
+- 저금리 대환대출, 정부 지원 대출, 신용등급 상향 등을 미끼로 접근함
+- 대출 실행 전 기존 대출 상환, 보증금, 수수료, 법무 비용, 보험료, 공탁금 등을 먼저 입금하라고 요구함
+- 금융회사 직원을 사칭하면서 개인 명의 계좌나 법인 명의가 아닌 계좌로 상환을 유도함
+- "다른 상담원은 확인이 안 될 수 있다", "대표번호로는 조회가 안 된다"처럼 정상적인 확인 절차를 우회시킴
+- 완납 증명서, 납부 확인서 등 실제로 존재하지 않거나 확인 불가능한 서류를 근거로 제시함
+- 중도 상환, 부결, 환급, 예치 등 금융 용어를 섞어 피해자를 혼란스럽게 만듦
+
+3. 가족 및 지인 사칭형
+- 자녀, 부모, 친척, 친구를 사칭하여 사고, 납치, 합의금, 병원비 등 긴급한 상황을 연출함
+- 휴대폰이 고장 났다거나 분실했다며 다른 번호나 메신저로 연락하고 본인 확인을 회피함
+- 상품권, 기프트카드 구매나 원격제어 앱 설치, 신분증 사진 전송을 요구함
+- 울음소리, 비명 등으로 심리적 압박을 가하고 생각할 시간을 주지 않음
+
+4. 금융 정보 및 개인정보 탈취형
+- 계좌번호, 비밀번호, 보안카드 번호, OTP, 인증번호, 주민등록번호, 카드 번호 및 CVC를 요구함
+- 출처를 알 수 없는 링크 클릭, 앱 설치, 원격 지원 프로그램 실행을 유도함
+- 정상적인 금융회사는 전화로 비밀번호나 인증번호 전체를 묻지 않음
+
+5. 심리적 압박 및 화법상의 특징
+- 지금 바로 처리하지 않으면 불이익, 체포, 계좌 정지, 신용 하락이 발생한다고 위협함
+- 반대로 지금 처리하면 환급, 감면, 우대 금리 등 이익이 있다고 회유함
+- 피해자의 질문에 구체적으로 답하지 않고 화제를 돌리거나 말을 길게 늘여 혼란을 줌
+- 소속, 이름, 직위, 부서명을 모호하게 말하거나 질문할 때마다 다르게 말함
+- 피해자가 제3자에게 확인하겠다고 하면 이를 막거나 다시 전화하겠다며 시간을 끔
+
+6. 정상 통화로 볼 수 있는 특징
+- 상대방이 공식 대표번호나 지점 방문을 통한 확인을 먼저 권유함
+- 금전 이동, 개인정보 제공, 앱 설치 요구가 전혀 없음
+- 통화 목적이 명확하고 질문에 일관되게 답변함
+- 일상적인 안부, 업무 협의, 예약 확인 등 금융 거래와 무관한 내용임
+"""
+
+# 검색 도구 호출 판단 기준 (검색 판단 프롬프트 전용)
+SEARCH_RULES = """
+[검색 도구 호출 판단 기준]
+
+- 이 단계에서는 보이스피싱 여부를 판단하거나 분석 내용을 작성하지 않습니다. 도구를 호출할지 여부만 결정합니다.
+- 아래 유형별 특징 중 하나라도 대화에 나타나면 voicephishing_check 도구를 호출합니다.
+- 검색어에는 대화에 등장한 기관명, 회사명, 부서명, 상품명, 수법을 나타내는 핵심 표현을 조합합니다.
+  예: "우리은행 대출 1팀 사칭 보이스피싱", "법무팀 예치 환급 대출 사기 수법"
+- 전화번호, 계좌번호가 언급되면 해당 번호와 "사기" 또는 "보이스피싱"을 함께 검색어로 사용합니다.
+- 개인정보(이름, 주민등록번호, 카드 번호 등)는 검색어에 포함하지 않습니다.
+- 검색어는 한 번의 호출에 하나만 사용하고, 20단어를 넘지 않게 작성합니다.
+- 일상 대화, 예약 확인, 업무 협의 등 금융 거래나 개인정보 요구가 전혀 없는 대화에서는 도구를 호출하지 않습니다.
+- 음성 인식 결과이므로 오탈자나 끊긴 문장이 있을 수 있으며, 불완전한 표현도 문맥상 의미를 추정하여 판단합니다.
+"""
+
+# 점수 산정 및 분석 규칙 (분석 프롬프트 전용)
+ANALYSIS_RULES = """
+[점수 산정 기준 및 분석 시 유의사항]
+
+1. 점수 산정 기준
+- 0~1점: 금융 거래나 개인정보와 무관한 일상 대화
+- 2~3점: 금융 관련 내용이 있으나 요구 사항이 없고 정상적인 확인 절차를 따름
+- 4~6점: 위 유형 중 일부 특징이 나타나지만 송금이나 정보 제공 요구가 명확하지 않음
+- 7~8점: 기관 또는 금융회사 사칭과 함께 송금, 상환, 정보 제공 요구가 나타남
+- 9~10점: 여러 유형의 특징이 복합적으로 나타나고 확인 절차 우회, 심리적 압박이 명확함
+
+2. 분석 시 유의사항
+- 음성 인식 결과이므로 오탈자, 끊긴 문장, 화자 구분 누락이 있을 수 있음을 감안함
+- 한 문장만으로 단정하지 말고 대화 전체의 흐름과 요구 사항을 종합하여 판단함
+- 의심 근거는 반드시 대화 내용의 해당 부분(시간 표시가 있다면 시간 포함)을 인용하여 제시함
+- 검색 결과를 인용할 때는 출처(제목, URL)를 함께 표기함
+"""
+
+
+class PhishingAnalysis(BaseModel):
+    """보이스피싱 분석 결과"""
+    score: int = Field(ge=0, le=10, description="보이스피싱 의심 정도 (0~10 사이의 정수)")
+    one_line: str = Field(description="진단 결과를 한 줄로 요약한 평가")
+    detail: str = Field(description="의심스러운 대화 부분과 검색 출처를 인용한 상세 설명 및 근거")
+    
+    def to_text(self) -> str:
+        """화면 표시용 텍스트로 변환"""
+        return f"score: {self.score}\n\n한 줄 평가: {self.one_line}\n\n상세 설명 및 근거: {self.detail}"
 
 
 class VoicePhishingDetector:
     """보이스피싱 탐지를 위한 LangGraph 모델 클래스"""
     
     def __init__(self):
+        from langchain_openai import ChatOpenAI
+        
+        _ensure_env()
         self.llm = ChatOpenAI(model="gpt-4o-mini")
         self._setup_prompts()
         self._setup_tools()
         self._build_graph()
+        
+        # LLM/검색 클라이언트의 연결 풀은 처음 사용한 이벤트 루프에 묶이므로,
+        # 모든 분석을 전용 스레드의 이벤트 루프 하나에서 실행
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="voice-phishing-detector", daemon=True).start()
     
     def _setup_prompts(self):
         """프롬프트 설정"""
+        from langchain_core.prompts import ChatPromptTemplate
+        
         self.search_prompt = ChatPromptTemplate.from_messages([
             ('system', """
 당신은 보이스피싱 탐지 전문가입니다.
@@ -39,7 +152,7 @@ class VoicePhishingDetector:
 - 기타 보이스피싱으로 의심되는 이상 징후가 보임
 
 단, 그걸 제외한 모든 상황에서는 툴을 호출하지 마세요.
-"""),
+""" + SEARCH_RULES + PHISHING_PATTERNS),
             ('human', '{context}')
         ])
 
@@ -47,29 +160,91 @@ class VoicePhishingDetector:
             ('system', """당신은 보이스피싱을 탐지하는 수사관입니다.
             텍스트로 된 전화 내용을 보고 보이스피싱 여부를 판단하십시오.
             만약 보이스피싱이라고 의심된다면 대화 내용 중 어디부분이 의심스러운 부분인지 짚으면서 설명해주세요. 검색 결과 중 관련 내용이 있다면 해당 출처와 자료를 인용해서 설명하세요.
-            분석을 시작하기 전 맨 앞에서 보이스피싱 의심여부를 0 ~ 10 사이의 숫자로 표시하세요"""),
-            ('human', '{context}'),
-            ('ai', '''
-score: [0~10 사이읜 숫자]
-한 줄 평가: [진단 결과를 한 줄로 평가가]
-상세 설명 및 근거: [하나씩 자세히 설명]
-            ''')
+            보이스피싱 의심여부는 0 ~ 10 사이의 점수로 평가하고, 진단 결과를 한 줄로 요약한 뒤 근거를 하나씩 자세히 설명하세요.
+""" + PHISHING_PATTERNS + ANALYSIS_RULES),
+            ('human', '{context}')
         ])
     
     def _setup_tools(self):
         """도구 설정"""
+        from langchain_core.tools import ToolException, tool
+        from langchain_tavily import TavilySearch
+        from langgraph.prebuilt import ToolNode
+        
         self.tavily_tool = TavilySearch(max_results=2)
-        self.tools = [self.tavily_tool]
+        
+        # 같은 검색어가 반복되는 경우가 많으므로 결과를 1시간 동안 캐시
+        # 여러 세션이 공유하므로 lock으로 보호하는 dict로 관리 (검색어 -> (만료 시각, 결과))
+        self._search_cache = OrderedDict()
+        self._search_cache_lock = threading.Lock()
+        
+        @tool
+        async def voicephishing_check(query: str):
+            """보이스피싱 수법, 피해 사례, 사칭 기관이나 연락처 등을 웹에서 검색합니다."""
+            cached = self._get_cached_search(query)
+            if cached is not None:
+                return list(cached)
+            
+            response = await self.tavily_tool.ainvoke({"query": query})
+            # 검색 결과가 없으면 TavilySearch가 안내 문자열을 반환 (캐시하지 않음)
+            if isinstance(response, str):
+                return response
+            if "error" in response:
+                raise ToolException(str(response["error"]))
+            
+            # 분석에 필요한 필드만 남겨 프롬프트 길이를 줄임
+            results = tuple(
+                {
+                    "title": item.get("title", ""),
+                    "url": item.get("url", ""),
+                    "content": (item.get("content") or "")[:500],
+                }
+                for item in response.get("results", [])
+            )
+            self._store_search(query, results)
+            return list(results)
+        
+        self.tools = [voicephishing_check]
         self.llm_tool = self.search_prompt | self.llm.bind_tools(self.tools)
-        self.analyze_chain = self.chat_prompt | self.llm
-        self.tool_node = ToolNode(self.tools)
+        # 점수/한 줄 평가/상세 설명을 구조화된 출력으로 받아 별도 파싱 없이 사용
+        self.analyze_chain = self.chat_prompt | self.llm.with_structured_output(
+            PhishingAnalysis, include_raw=True
+        )
+        # 검색 실패 시 분석 전체를 중단하지 않고 오류 메시지를 결과로 전달
+        self.tool_node = ToolNode(self.tools, handle_tool_errors=True)
+    
+    def _get_cached_search(self, query):
+        """캐시된 검색 결과 반환 (없거나 만료되었으면 None)"""
+        with self._search_cache_lock:
+            entry = self._search_cache.get(query)
+            if entry is None:
+                return None
+            expires_at, results = entry
+            if expires_at < time.monotonic():
+                del self._search_cache[query]
+                return None
+            self._search_cache.move_to_end(query)
+            return results
+    
+    def _store_search(self, query, results):
+        """검색 결과 캐시 저장 (오래된 항목부터 제거)"""
+        with self._search_cache_lock:
+            self._search_cache[query] = (time.monotonic() + SEARCH_CACHE_TTL, results)
+            self._search_cache.move_to_end(query)
+            while len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
     
     def _build_graph(self):
         """그래프 구성"""
+        from langgraph.graph import StateGraph
+        from langgraph.graph.message import add_messages
+        
         # State 정의
         class State(TypedDict):
             messages: Annotated[list, add_messages]
             dummy_data: Annotated[list, add_messages]
+            analysis: Optional[PhishingAnalysis]
+            cached_tokens: Annotated[int, operator.add]
         
         self.State = State
         
@@ -90,37 +265,98 @@ score: [0~10 사이읜 숫자]
         # 그래프 컴파일
         self.vp_search = graph_builder.compile()
     
-    def _answer_node(self, state):
+    async def _answer_node(self, state):
         """분석 노드"""
+        from langchain_core.messages import AIMessage
+        
+        output = await self.analyze_chain.ainvoke({'context': state["messages"]})
+        cached_tokens = self._log_cache_usage("answer", output["raw"])
+        analysis = output["parsed"]
+        if analysis is not None:
+            content = analysis.to_text()
+        else:
+            content = f"분석 결과를 해석하지 못했습니다: {output['parsing_error'] or '응답 형식 불일치'}"
         return {
-            "messages": self.analyze_chain.invoke({'context': state["messages"]}), 
-            "dummy_data": 'anal step'
+            "messages": AIMessage(content=content), 
+            "dummy_data": 'anal step',
+            "analysis": analysis,
+            "cached_tokens": cached_tokens
         }
     
-    def _search_node(self, state):
+    def _log_cache_usage(self, step, response):
+        """프롬프트 캐시 적중 토큰 수 출력 후 반환 (모니터링용)"""
+        usage = response.usage_metadata or {}
+        cached_tokens = usage.get("input_token_details", {}).get("cache_read", 0) or 0
+        print(f"[{step}] 프롬프트 토큰: {usage.get('input_tokens', 0)}, 캐시 적중 토큰: {cached_tokens}")
+        return cached_tokens
+    
+    async def _search_node(self, state):
         """검색 노드"""
-        return {'context': [self.llm_tool.invoke(state['messages'])]}
+        response = await self.llm_tool.ainvoke(state['messages'])
+        return {
+            'messages': [response],
+            'cached_tokens': self._log_cache_usage("search", response)
+        }
     
     def _custom_tools_condition(self, state):
         """도구 사용 조건 판단"""
         last_message = state['messages'][-1]
-        if "tool_calls" in last_message.additional_kwargs:
+        if getattr(last_message, "tool_calls", None):
             return "tools"
         else:
             return "answer"
     
+    async def _analyze(self, text: str) -> dict:
+        """그래프 실행 (탐지기 전용 이벤트 루프에서만 호출)"""
+        result = await self.vp_search.ainvoke({'messages': text, 'cached_tokens': 0})
+        analysis = result.get("analysis")
+        return {
+            "score": analysis.score if analysis is not None else None,
+            "content": result["messages"][-1].content,
+            "cached_tokens": result["cached_tokens"]
+        }
+    
+    def submit(self, text: str) -> concurrent.futures.Future:
+        """분석을 탐지기 전용 이벤트 루프에 예약하고 Future 반환"""
+        return asyncio.run_coroutine_threadsafe(self._analyze(text), self._loop)
+    
+    async def analyze_async(self, text: str) -> dict:
+        """텍스트 분석 후 {"score", "content", "cached_tokens"} 반환 (점수를 얻지 못하면 score는 None)
+        어느 이벤트 루프에서 호출해도 실제 실행은 탐지기 전용 루프에서 이루어짐"""
+        return await asyncio.wrap_future(self.submit(text))
+    
+    async def analyze_text_async(self, text: str) -> str:
+        """텍스트 분석 메인 함수 (비동기)"""
+        return (await self.analyze_async(text))["content"]
+    
     def analyze_text(self, text: str) -> str:
         """텍스트 분석 메인 함수"""
-        result = self.vp_search.invoke({'messages': text})
-        return result["messages"][-1].content
+        return self.submit(text).result()["content"]
+
+
+# 그래프 컴파일/도구 생성은 입력과 무관하므로 한 번만 수행
+_DETECTOR: Optional[VoicePhishingDetector] = None
+
+
+def get_detector() -> VoicePhishingDetector:
+    """공유 탐지기 인스턴스 반환 (최초 호출 시 생성)"""
+    global _DETECTOR
+    if _DETECTOR is None:
+        _DETECTOR = VoicePhishingDetector()
+    return _DETECTOR
 
 
 # 외부에서 사용할 수 있는 함수
 def analyze_voice_phishing(text: str) -> str:
     """보이스피싱 분석 함수"""
 
-    detector = VoicePhishingDetector()
-    return detector.analyze_text(text)
+    return get_detector().analyze_text(text)
+
+
+async def analyze_voice_phishing_async(text: str) -> str:
+    """보이스피싱 분석 함수 (비동기)"""
+
+    return await get_detector().analyze_text_async(text)
 
 
 # 테스트용 코드 (직접 실행 시에만 동작)
@@ -1,16 +1,67 @@
-import whisper
-import librosa
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+from faster_whisper.feature_extractor import FeatureExtractor
+from faster_whisper.transcribe import TranscriptionInfo
+import ctranslate2
+import numpy as np
+import soundfile as sf
 import torch
+import torchaudio.functional as AF
+import io
 import os
 from datetime import datetime
 import argparse
 
+class TorchFeatureExtractor(FeatureExtractor):
+    """
+    log-Mel 스펙트로그램(STFT + mel 필터)을 GPU에서 계산하는 FeatureExtractor
+    mel 필터와 Hann 윈도우는 생성 시 한 번만 디바이스에 올려 재사용
+    """
+    def __init__(self, device="cuda", **kwargs):
+        super().__init__(**kwargs)
+        self.device = device
+        self.mel_filters_tensor = torch.from_numpy(self.mel_filters).to(device)
+        self.window = torch.hann_window(self.n_fft, device=device)
+    
+    @torch.no_grad()
+    def __call__(self, waveform, padding=160, chunk_length=None):
+        if chunk_length is not None:
+            self.n_samples = chunk_length * self.sampling_rate
+            self.nb_max_frames = self.n_samples // self.hop_length
+        
+        audio = torch.from_numpy(np.asarray(waveform, dtype=np.float32)).to(self.device)
+        if padding:
+            audio = torch.nn.functional.pad(audio, (0, padding))
+        
+        stft = torch.stft(audio, self.n_fft, self.hop_length, window=self.window, return_complex=True)
+        magnitudes = stft[..., :-1].abs() ** 2
+        
+        mel_spec = self.mel_filters_tensor @ magnitudes
+        log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+        log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
+        log_spec = (log_spec + 4.0) / 4.0
+        
+        # CTranslate2 모델 입력은 numpy 배열
+        return log_spec.cpu().numpy()
+
 class VoiceToTextConverter:
-    def __init__(self, model_size="base"):
+    # 디코딩 설정 (기본값은 greedy 디코딩, 정확도가 더 필요하면 인스턴스/서브클래스에서 변경)
+    beam_size = 1
+    best_of = 1
+    temperature = 0.0  # 단일 값이면 temperature fallback 재디코딩이 일어나지 않음
+    condition_on_previous_text = False  # 이전 구간 오류 전파 방지, 구간 간 독립 디코딩
+    without_timestamps = False
+    
+    # Silero VAD 설정 (0.5초 이상 무음 구간은 잘라내고 음성 구간만 디코딩)
+    vad_parameters = {"min_silence_duration_ms": 500}
+    
+    def __init__(self, model_size="base", batch_size=16):
         """
         Whisper 모델 초기화
         model_size: tiny, base, small, medium, large
+        batch_size: 긴 오디오 처리 시 한 번에 디코딩할 구간 수
         """
+        self.batch_size = batch_size
+        
         # GPU 사용 가능 여부 확인
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"사용 가능한 디바이스: {self.device}")
@@ -29,122 +80,175 @@ class VoiceToTextConverter:
         
         print(f"Whisper {model_size} 모델을 로딩 중...")
         
+        # CTranslate2 양자화 설정 (GPU: int8 가중치 + bf16/fp16 연산, CPU: int8)
+        if self.device == "cuda":
+            # bf16 커널 지원 여부는 torch가 아닌 CTranslate2 기준으로 확인 (T4/V100 등은 미지원)
+            supported = ctranslate2.get_supported_compute_types("cuda")
+            self.compute_type = "int8_bfloat16" if "int8_bfloat16" in supported else "int8_float16"
+        else:
+            self.compute_type = "int8"
+        
         try:
-            self.model = whisper.load_model(model_size, device=self.device)
+            self.model = WhisperModel(model_size, device=self.device, compute_type=self.compute_type)
             print("모델 로딩 완료!")
         except Exception as e:
             if "out of memory" in str(e).lower():
                 print("GPU 메모리 부족으로 CPU로 전환합니다...")
                 self.device = "cpu"
-                self.model = whisper.load_model(model_size, device=self.device)
+                self.compute_type = "int8"
+                self.model = WhisperModel(model_size, device=self.device, compute_type=self.compute_type)
                 print("CPU로 모델 로딩 완료!")
             else:
                 raise e
+        
+        # GPU 사용 시 특징 추출도 GPU에서 수행
+        if self.device == "cuda":
+            self.model.feature_extractor = TorchFeatureExtractor(device=self.device, **self.model.feat_kwargs)
+        
+        # 긴 오디오를 VAD 구간 단위로 묶어 배치 추론하는 파이프라인
+        self.batched_model = BatchedInferencePipeline(model=self.model)
     
-    def transcribe_audio(self, audio_file_path, language="ko"):
+    def transcribe_audio(self, audio_file, language="ko"):
         """
-        librosa를 사용하여 오디오 파일을 텍스트로 변환
+        오디오 파일을 텍스트로 변환
+        audio_file: 파일 경로 또는 파일 객체(업로드된 파일 등)
         """
-        # 파일 존재 확인
-        if not os.path.exists(audio_file_path):
-            raise FileNotFoundError(f"파일을 찾을 수 없습니다: {audio_file_path}")
+        segments, info = self.transcribe_stream(audio_file, language)
         
-        print(f"음성 파일 변환 중: {audio_file_path}")
-        print(f"파일 크기: {os.path.getsize(audio_file_path)} bytes")
+        try:
+            result_segments = list(segments)
+        except Exception as e:
+            raise Exception(f"음성 인식 실패: {str(e)}")
+        
+        print("✅ 음성 인식 완료!")
+        return {
+            "text": "".join(segment["text"] for segment in result_segments).strip(),
+            "segments": result_segments,
+            "language": info.language
+        }
+    
+    def transcribe_stream(self, audio_file, language="ko"):
+        """
+        오디오 파일을 세그먼트 단위로 변환
+        반환값: (세그먼트 제너레이터, TranscriptionInfo)
+        세그먼트({"start", "end", "text"})는 디코딩되는 즉시 하나씩 생성됨
+        """
+        if hasattr(audio_file, "read"):
+            # 파일 객체는 디스크를 거치지 않고 메모리 버퍼에서 바로 디코딩
+            data = audio_file.getvalue() if hasattr(audio_file, "getvalue") else audio_file.read()
+            audio_file = io.BytesIO(data)
+            print("음성 파일 변환 중: 메모리 버퍼")
+            print(f"파일 크기: {len(data)} bytes")
+        else:
+            # 파일 존재 확인
+            if not os.path.exists(audio_file):
+                raise FileNotFoundError(f"파일을 찾을 수 없습니다: {audio_file}")
+            
+            print(f"음성 파일 변환 중: {audio_file}")
+            print(f"파일 크기: {os.path.getsize(audio_file)} bytes")
         
         try:
-            # librosa로 오디오 파일 로드 (16kHz로 리샘플링)
+            # 오디오 파일 로드 (16kHz 모노로 변환)
             print("오디오 파일 로딩 중...")
-            audio_data, sr = librosa.load(audio_file_path, sr=16000)
+            audio_data, sr, is_silent = self._load_audio(audio_file)
             print(f"오디오 로드 완료: 샘플레이트={sr}Hz, 길이={len(audio_data)/sr:.2f}초")
             
+            # 무음에 가까운 오디오는 VAD/모델을 거치지 않고 빈 결과 반환
+            if is_silent:
+                print("무음에 가까운 오디오입니다. 음성 인식을 건너뜁니다.")
+                info = TranscriptionInfo(
+                    language=language if language != "auto" else "",
+                    language_probability=0.0,
+                    duration=len(audio_data) / sr,
+                    duration_after_vad=0.0,
+                    all_language_probs=None,
+                    transcription_options=None,
+                    vad_options=None,
+                )
+                return iter(()), info
+            
             # Whisper로 음성 인식 (numpy 배열 직접 전달)
             print("음성 인식 처리 중...")
             
-            # NaN 값 방지를 위한 추가 옵션들
+            # 수치 정밀도는 CTranslate2가 compute_type에 맞춰 처리
             transcribe_options = {
-                "language": language,
-                "verbose": True,
-                "fp16": False,  # NaN 문제 해결을 위해 fp16 비활성화
-                "temperature": 0.0,  # 온도를 0으로 설정하여 안정성 향상
-                "compression_ratio_threshold": 2.4,
-                "logprob_threshold": -1.0,
-                "no_speech_threshold": 0.6
+                "language": None if language == "auto" else language,
+                "beam_size": self.beam_size,
+                "best_of": self.best_of,
+                "temperature": self.temperature,
+                "condition_on_previous_text": self.condition_on_previous_text,
+                "without_timestamps": self.without_timestamps,
+                "vad_filter": True,
+                # 파이프라인이 dict를 변경할 수 있으므로 클래스 속성의 복사본 전달
+                "vad_parameters": dict(self.vad_parameters),
             }
             
-            # 긴 오디오의 경우 청크 단위로 분할 처리
-            if len(audio_data) > 16000 * 30:  # 30초 이상인 경우
-                print("긴 오디오 파일입니다. 청크 단위로 처리합니다...")
-                result = self._process_long_audio(audio_data, transcribe_options)
+            # 30초 이상인 경우 구간들을 배치로 묶어 한 번에 처리
+            if len(audio_data) > 16000 * 30:
+                print(f"긴 오디오 파일입니다. 배치 단위({self.batch_size})로 처리합니다...")
+                segments, info = self.batched_model.transcribe(
+                    audio_data, batch_size=self.batch_size, **transcribe_options
+                )
             else:
-                result = self.model.transcribe(audio_data, **transcribe_options)
+                segments, info = self.model.transcribe(audio_data, **transcribe_options)
             
-            print("✅ 음성 인식 완료!")
-            return result
+            return self._iter_segments(segments), info
             
         except Exception as e:
             raise Exception(f"음성 인식 실패: {str(e)}")
     
-    def _process_long_audio(self, audio_data, transcribe_options):
+    def _load_audio(self, audio_file, sample_rate=16000):
         """
-        긴 오디오를 청크 단위로 분할하여 처리
+        soundfile로 오디오를 float32 모노로 읽고 필요 시 torchaudio로 리샘플링
+        (soundfile이 지원하지 않는 mp3/m4a 등은 PyAV 기반 decode_audio로 디코딩)
+        반환값: (오디오 배열, 샘플레이트, 무음 여부)
         """
-        import numpy as np
+        try:
+            audio_data, sr = sf.read(audio_file, dtype="float32", always_2d=False)
+        except sf.LibsndfileError:
+            if hasattr(audio_file, "seek"):
+                audio_file.seek(0)
+            audio_data, sr = decode_audio(audio_file, sampling_rate=sample_rate), sample_rate
         
-        chunk_length = 30  # 30초 청크
-        sample_rate = 16000
-        chunk_samples = chunk_length * sample_rate
+        if audio_data.ndim == 2:
+            audio_data = audio_data.mean(axis=1)
         
-        # 전체 결과를 저장할 구조
-        full_result = {
-            "text": "",
-            "segments": [],
-            "language": transcribe_options.get("language", "ko")
-        }
+        if sr != sample_rate:
+            audio_data = AF.resample(torch.from_numpy(audio_data), sr, sample_rate).numpy()
         
-        # 오디오를 청크로 분할
-        total_chunks = len(audio_data) // chunk_samples + (1 if len(audio_data) % chunk_samples > 0 else 0)
-        print(f"총 {total_chunks}개 청크로 분할하여 처리합니다...")
+        # 반정밀도 연산에서 NaN이 생기지 않도록 비정상 값 제거 및 DC 오프셋 제거
+        audio_data = np.nan_to_num(audio_data, nan=0.0, posinf=0.0, neginf=0.0)
+        if len(audio_data):
+            audio_data = audio_data - audio_data.mean()
         
-        current_time_offset = 0.0
+        # 피크 정규화 (무음에 가까운 오디오는 잡음이 증폭되어 VAD를 통과하지 않도록 그대로 둠)
+        is_silent = self._is_silent(audio_data)
+        if not is_silent:
+            audio_data = audio_data / np.max(np.abs(audio_data))
         
-        for i in range(total_chunks):
-            start_sample = i * chunk_samples
-            end_sample = min((i + 1) * chunk_samples, len(audio_data))
-            chunk_audio = audio_data[start_sample:end_sample]
-            
-            # 너무 짧은 청크는 건너뛰기
-            if len(chunk_audio) < sample_rate * 0.5:  # 0.5초 미만
-                continue
-            
-            print(f"청크 {i+1}/{total_chunks} 처리 중... ({start_sample/sample_rate:.1f}s - {end_sample/sample_rate:.1f}s)")
-            
-            try:
-                # 각 청크 처리
-                chunk_result = self.model.transcribe(chunk_audio, **transcribe_options)
-                
-                # 텍스트 결합
-                if chunk_result["text"].strip():
-                    full_result["text"] += chunk_result["text"] + " "
-                
-                # 세그먼트 시간 조정 후 추가
-                for segment in chunk_result["segments"]:
-                    adjusted_segment = segment.copy()
-                    adjusted_segment["start"] += current_time_offset
-                    adjusted_segment["end"] += current_time_offset
-                    full_result["segments"].append(adjusted_segment)
-                
-            except Exception as e:
-                print(f"청크 {i+1} 처리 중 오류 발생: {str(e)}")
-                continue
-            
-            current_time_offset = end_sample / sample_rate
-        
-        # 텍스트 정리
-        full_result["text"] = full_result["text"].strip()
-        
-        print(f"모든 청크 처리 완료! 총 텍스트 길이: {len(full_result['text'])}자")
-        return full_result
+        return np.ascontiguousarray(audio_data, dtype=np.float32), sample_rate, is_silent
+    
+    def _is_silent(self, audio_data, rms_threshold=0.005, peak_threshold=0.02):
+        """
+        RMS와 피크 값으로 무음 여부 판단 (numpy 벡터 연산)
+        """
+        if len(audio_data) == 0:
+            return True
+        rms = np.sqrt(np.mean(np.square(audio_data, dtype=np.float32)))
+        peak = np.max(np.abs(audio_data))
+        return rms < rms_threshold and peak < peak_threshold
+    
+    def _iter_segments(self, segments):
+        """
+        faster-whisper 세그먼트를 {"start", "end", "text"} dict로 변환하며 진행 상황 출력
+        """
+        for segment in segments:
+            print(f"[{self.format_time(segment.start)} - {self.format_time(segment.end)}] {segment.text}")
+            yield {
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text
+            }
     
     def save_transcript(self, result, output_file=None):
         """
@@ -213,7 +317,7 @@ class VoiceToTextConverter:
             }
 
 def main():
-    parser = argparse.ArgumentParser(description="Whisper를 사용한 통화 녹음 음성인식")
+    parser = argparse.ArgumentParser(description="faster-whisper를 사용한 통화 녹음 음성인식")
     parser.add_argument("audio_file", help="변환할 오디오 파일 경로")
     parser.add_argument("-o", "--output", help="출력 텍스트 파일명")
     parser.add_argument("-m", "--model", default="base", 